@@ -0,0 +1,114 @@
+# Default libraries
+import argparse
+import csv
+from pathlib import Path
+
+# Custom libraries
+from helpers.crawler import (
+    Frontier,
+    HostPolicy,
+    SectionCrawler,
+    get_country_urls,
+    get_soup_from_url,
+    rewrite_url_to_mirror,
+)
+
+
+MAIN_URL = "https://www.esn.org/sections"
+RECORD_FIELDS = ["name", "city", "url", "country"]
+
+
+# Setup argument parser
+def setup_argparser():
+    ap = argparse.ArgumentParser(description="ESN per-section crawler")
+    ap.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        default="sections.csv",
+        help="CSV file for the section records (default is 'sections.csv')",
+    )
+    ap.add_argument(
+        "-cp",
+        "--checkpoint",
+        type=str,
+        default="crawl_checkpoint.json",
+        help="checkpoint file used to resume an interrupted crawl (default is 'crawl_checkpoint.json')",
+    )
+    ap.add_argument(
+        "-m",
+        "--mirror",
+        type=str,
+        default=None,
+        help="crawl a local mirror of the website instead, e.g. 'http://localhost:8000'",
+    )
+    ap.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=8,
+        help="number of fetching threads (default is 8)",
+    )
+    ap.add_argument(
+        "-hc",
+        "--host-concurrency",
+        type=int,
+        default=2,
+        help="maximum number of simultaneous requests per host (default is 2)",
+    )
+    ap.add_argument(
+        "-d",
+        "--delay",
+        type=float,
+        default=0.5,
+        help="minimum delay in seconds between two requests to the same host (default is 0.5)",
+    )
+    ap.add_argument(
+        "-r",
+        "--restart",
+        action="store_true",
+        help="ignore an existing checkpoint and start from scratch",
+    )
+
+    return ap
+
+
+def write_records(path, records):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=RECORD_FIELDS)
+        writer.writeheader()
+        writer.writerows(sorted(records, key=lambda r: (r["country"] or "", r["name"] or "")))
+
+
+if __name__ == "__main__":
+    args = vars(setup_argparser().parse_args())
+
+    checkpoint_path = Path(args["checkpoint"])
+    if args["restart"] and checkpoint_path.is_file():
+        checkpoint_path.unlink()
+
+    frontier = Frontier(checkpoint_path=checkpoint_path)
+    crawler = SectionCrawler(
+        frontier,
+        host_policy=HostPolicy(concurrency=args["host_concurrency"], delay=args["delay"]),
+        mirror_url=args["mirror"],
+        max_workers=args["workers"],
+    )
+
+    if frontier.load():
+        print(f"Resuming from checkpoint ({frontier.fetched_count} pages already fetched)")
+    else:
+        main_url = rewrite_url_to_mirror(MAIN_URL, args["mirror"])
+        main_soup = get_soup_from_url(main_url, session=crawler.session)
+        crawler.add_country_urls(get_country_urls(main_soup, base_url=main_url))
+
+    stats = crawler.run()
+    write_records(args["output"], frontier.records)
+
+    print(
+        "Fetched {pages} pages ({pages_per_second:.1f} pages/s), found {sections} sections, {failed} failed".format(
+            **stats
+        )
+    )
+    for url, error in frontier.failed.items():
+        print(f'Failed to fetch "{url}": {error}')
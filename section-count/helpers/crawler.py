@@ -0,0 +1,419 @@
+# Default libraries
+import heapq
+import itertools
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from unicodedata import normalize
+from urllib.parse import urljoin, urlsplit, urlunsplit
+
+# External libraries
+import requests
+import tqdm
+from requests.adapters import HTTPAdapter
+from bs4 import BeautifulSoup
+
+
+# Selectors for the ESN website, kept here so they can be adjusted if the layout changes
+PAGE_HEADER_SELECTOR = "h1.page-header"
+SECTION_LINK_SELECTOR = ".view-content a[href]"
+SECTION_LINK_REGEX = re.compile(r"/section/[^/?#]+/?$")
+SECTION_CITY_SELECTOR = ".field-name-field-city"
+
+KIND_COUNTRY = "country"
+KIND_SECTION = "section"
+
+DEFAULT_USER_AGENT = "esntools-section-count (+https://www.github.com/DavidResin/esntools)"
+
+
+def get_soup_from_text(text):
+    return BeautifulSoup(text, "lxml")
+
+
+def get_soup_from_url(url, session=None, timeout=30):
+    page = (session or requests).get(url, timeout=timeout)
+    page.raise_for_status()
+    # Raw bytes, so that the encoding is detected when the server doesn't send one (e.g. a local mirror)
+    return get_soup_from_text(page.content)
+
+
+# Client errors won't change on a retry, except for rate limiting
+def is_retryable_error(error):
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        status = error.response.status_code
+        return status == 429 or status >= 500
+
+    return isinstance(error, requests.RequestException)
+
+
+# Seconds to wait asked by the server in a Retry-After header, or None
+def get_retry_after(error):
+    response = getattr(error, "response", None)
+    value = response.headers.get("Retry-After") if response is not None else None
+
+    if value is None:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def clean_text(text):
+    return normalize("NFKD", text).strip()
+
+
+def get_url_host(url):
+    return urlsplit(url).netloc.lower()
+
+
+# Canonical form of a URL used for deduplication
+def normalize_url(url):
+    parts = urlsplit(url)
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit(
+        (parts.scheme.lower(), parts.netloc.lower(), path, parts.query, "")
+    )
+
+
+# Point a website URL to a local mirror, keeping its path and query
+def rewrite_url_to_mirror(url, mirror_url):
+    if mirror_url is None:
+        return url
+
+    mirror = urlsplit(mirror_url)
+    parts = urlsplit(url)
+    return urlunsplit((mirror.scheme, mirror.netloc, parts.path, parts.query, ""))
+
+
+# Block of the main sections page holding the global counts and the country list
+def get_main_content(main_soup):
+    return main_soup.find(id="content-block").find("div").find("div").find("div").find("div")
+
+
+# Country page URLs listed on the main sections page
+def get_country_urls(main_soup, base_url):
+    main_content = get_main_content(main_soup)
+    country_divs = main_content.find("div").find_all("div")
+    anchors = [elem.find("a") for elem in country_divs]
+    return [urljoin(base_url, elem["href"]) for elem in anchors if elem is not None]
+
+
+# National organisation name as shown in the header of a country page
+def get_national_org_name(soup):
+    header = soup.select_one(PAGE_HEADER_SELECTOR)
+    return clean_text(header.text) if header is not None else None
+
+
+# Section links and national organisation name from a country page
+def parse_country_page(soup, page_url):
+    country = get_national_org_name(soup)
+
+    section_urls = []
+    for anchor in soup.select(SECTION_LINK_SELECTOR):
+        url = normalize_url(urljoin(page_url, anchor["href"]))
+        if SECTION_LINK_REGEX.search(urlsplit(url).path) and url not in section_urls:
+            section_urls.append(url)
+
+    return country, section_urls
+
+
+# Section record from a section page
+def parse_section_page(soup, page_url, country):
+    header = soup.select_one(PAGE_HEADER_SELECTOR)
+    city = soup.select_one(SECTION_CITY_SELECTOR)
+
+    return {
+        "name": clean_text(header.text) if header is not None else None,
+        "city": clean_text(city.text) if city is not None else None,
+        "url": page_url,
+        "country": country,
+    }
+
+
+# Limit concurrent requests and enforce a minimum delay between requests for each host
+class HostPolicy:
+    def __init__(self, concurrency=2, delay=1.0):
+        self.concurrency = concurrency
+        self.delay = delay
+        self._lock = threading.Lock()
+        self._semaphores = {}
+        self._next_start = {}
+
+    def _semaphore(self, host):
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(self.concurrency)
+            return self._semaphores[host]
+
+    def acquire(self, host):
+        self._semaphore(host).acquire()
+
+        # Reserve the next start slot for this host, then sleep outside of the lock
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start.get(host, now))
+            self._next_start[host] = start + self.delay
+
+        time.sleep(max(0.0, start - now))
+
+    def release(self, host):
+        self._semaphore(host).release()
+
+
+# Deduplicated crawl queue with checkpointing, only used from the scheduling thread
+class Frontier:
+    def __init__(self, checkpoint_path=None, max_retries=2):
+        self.checkpoint_path = Path(checkpoint_path) if checkpoint_path else None
+        self.max_retries = max_retries
+        self.queue = deque()
+        # Heap of (not before, order, task) for retries waiting for their delay
+        self.delayed = []
+        self._order = itertools.count()
+        self.in_flight = {}
+        self.seen = set()
+        self.retries = {}
+        self.records = []
+        self.failed = {}
+        self.fetched_count = 0
+
+    def add(self, url, kind, meta=None):
+        url = normalize_url(url)
+
+        if url in self.seen:
+            return False
+
+        self.seen.add(url)
+        self.queue.append((url, kind, meta or {}))
+        return True
+
+    def pop(self):
+        task = self.queue.popleft()
+        self.in_flight[task[0]] = task
+        return task
+
+    def done(self, url):
+        self.in_flight.pop(url, None)
+        self.retries.pop(url, None)
+        self.fetched_count += 1
+
+    def attempts(self, url):
+        return self.retries.get(url, 0)
+
+    # Requeue a failed task after a delay until it runs out of retries, a None delay never retries
+    # Returns True if the task was requeued
+    def fail(self, url, error, delay=None):
+        task = self.in_flight.pop(url)
+        attempts = self.attempts(url) + 1
+
+        if delay is not None and attempts <= self.max_retries:
+            self.retries[url] = attempts
+            heapq.heappush(self.delayed, (time.monotonic() + delay, next(self._order), task))
+            return True
+
+        self.retries.pop(url, None)
+        self.failed[url] = str(error)
+        return False
+
+    def has_pending(self):
+        # Move the retries that are due back to the queue
+        now = time.monotonic()
+        while self.delayed and self.delayed[0][0] <= now:
+            self.queue.append(heapq.heappop(self.delayed)[2])
+
+        return bool(self.queue)
+
+    # Seconds until the next delayed retry is due, None if there is none
+    def next_retry_in(self):
+        if not self.delayed:
+            return None
+
+        return max(0.0, self.delayed[0][0] - time.monotonic())
+
+    def is_finished(self):
+        return not self.queue and not self.delayed and not self.in_flight
+
+    def to_dict(self):
+        # In-flight and delayed tasks are saved as pending so that they are fetched again on resume
+        pending = (
+            list(self.in_flight.values())
+            + [task for _, _, task in sorted(self.delayed)]
+            + list(self.queue)
+        )
+        return {
+            "pending": [list(task) for task in pending],
+            "seen": sorted(self.seen),
+            "retries": self.retries,
+            "records": self.records,
+            "failed": self.failed,
+            "fetched_count": self.fetched_count,
+        }
+
+    def save(self):
+        if self.checkpoint_path is None:
+            return
+
+        tmp_path = self.checkpoint_path.with_suffix(self.checkpoint_path.suffix + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f)
+
+        os.replace(tmp_path, self.checkpoint_path)
+
+    # Restore the state saved by a previous run, returns False if there is none
+    def load(self):
+        if self.checkpoint_path is None or not self.checkpoint_path.is_file():
+            return False
+
+        with open(self.checkpoint_path, encoding="utf-8") as f:
+            state = json.load(f)
+
+        self.queue = deque(tuple(task) for task in state["pending"])
+        self.delayed = []
+        self.in_flight = {}
+        self.seen = set(state["seen"])
+        self.retries = state["retries"]
+        self.records = state["records"]
+        self.failed = state["failed"]
+        self.fetched_count = state["fetched_count"]
+        return True
+
+
+class SectionCrawler:
+    def __init__(
+        self,
+        frontier,
+        host_policy,
+        mirror_url=None,
+        max_workers=8,
+        checkpoint_every=25,
+        timeout=30,
+        retry_delay=5.0,
+        user_agent=DEFAULT_USER_AGENT,
+    ):
+        self.frontier = frontier
+        self.host_policy = host_policy
+        self.mirror_url = mirror_url
+        self.max_workers = max_workers
+        self.checkpoint_every = checkpoint_every
+        self.timeout = timeout
+        self.retry_delay = retry_delay
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = user_agent
+
+        # Pooled connections so that workers reuse keep-alive sockets
+        adapter = HTTPAdapter(
+            pool_connections=max_workers, pool_maxsize=max_workers
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def add_country_urls(self, country_urls):
+        for url in country_urls:
+            self.frontier.add(rewrite_url_to_mirror(url, self.mirror_url), KIND_COUNTRY)
+
+    # Runs in a worker thread, only fetches and parses
+    def fetch(self, task):
+        url, kind, meta = task
+        host = get_url_host(url)
+
+        self.host_policy.acquire(host)
+        try:
+            soup = get_soup_from_url(url, session=self.session, timeout=self.timeout)
+        finally:
+            self.host_policy.release(host)
+
+        if kind == KIND_COUNTRY:
+            return parse_country_page(soup, url)
+
+        return parse_section_page(soup, url, meta.get("country"))
+
+    # Runs in the scheduling thread, updates the frontier with the parsed result
+    def handle_result(self, task, result):
+        url, kind, meta = task
+
+        if kind == KIND_COUNTRY:
+            country, section_urls = result
+            for section_url in section_urls:
+                self.frontier.add(
+                    rewrite_url_to_mirror(section_url, self.mirror_url),
+                    KIND_SECTION,
+                    {"country": country},
+                )
+        else:
+            self.frontier.records.append(result)
+
+        self.frontier.done(url)
+
+    # Exponential backoff for the failed URL only, or None if retrying is pointless
+    def get_retry_delay(self, task, error):
+        if not is_retryable_error(error):
+            return None
+
+        delay = self.retry_delay * 2 ** self.frontier.attempts(task[0])
+        return max(delay, get_retry_after(error) or 0.0)
+
+    def run(self):
+        frontier = self.frontier
+        futures = {}
+        start_time = time.monotonic()
+        start_count = frontier.fetched_count
+        progress = tqdm.tqdm(
+            total=len(frontier.seen), initial=frontier.fetched_count + len(frontier.failed)
+        )
+
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+
+        try:
+            while not frontier.is_finished():
+                # Keep a bounded number of tasks submitted at any time
+                while frontier.has_pending() and len(futures) < 2 * self.max_workers:
+                    task = frontier.pop()
+                    futures[executor.submit(self.fetch, task)] = task
+
+                # Wake up for the next delayed retry even if no fetch completes
+                completed, _ = wait(
+                    futures, timeout=frontier.next_retry_in(), return_when=FIRST_COMPLETED
+                )
+
+                for future in completed:
+                    task = futures.pop(future)
+                    try:
+                        self.handle_result(task, future.result())
+                    except Exception as e:
+                        # Pages failing for good are done too, requeued ones are not
+                        if frontier.fail(task[0], e, delay=self.get_retry_delay(task, e)):
+                            continue
+                    else:
+                        if frontier.fetched_count % self.checkpoint_every == 0:
+                            frontier.save()
+
+                    progress.total = len(frontier.seen)
+                    progress.update(1)
+        finally:
+            # Unfinished tasks stay pending in the checkpoint and are fetched again on resume
+            executor.shutdown(wait=False, cancel_futures=True)
+            frontier.save()
+            progress.close()
+
+        elapsed = time.monotonic() - start_time
+        pages_per_second = (frontier.fetched_count - start_count) / max(elapsed, 1e-9)
+
+        return {
+            "pages": frontier.fetched_count,
+            "sections": len(frontier.records),
+            "failed": len(frontier.failed),
+            "elapsed": elapsed,
+            "pages_per_second": pages_per_second,
+        }
@@ -0,0 +1,6 @@
+# Default libraries
+import sys
+from pathlib import Path
+
+# The script and notebook import their helpers relative to the section-count folder
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
@@ -0,0 +1,174 @@
+# Default libraries
+import threading
+import time
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+# External libraries
+import pytest
+import requests
+
+# Custom libraries
+from helpers.crawler import (
+    Frontier,
+    HostPolicy,
+    SectionCrawler,
+    get_country_urls,
+    get_retry_after,
+    get_soup_from_url,
+    is_retryable_error,
+    rewrite_url_to_mirror,
+)
+
+
+MAIN_URL = "https://www.esn.org/sections"
+
+# Small copy of the website: the same sections are linked twice, with and without a trailing slash
+# The France header has a non-breaking space, like on the website
+MIRROR_PAGES = {
+    "sections/index.html": """<html><body><div id="content-block"><div><div><div><div>
+<p>The ESN network consists at this moment of 4 local sections in 2 countries.</p><div>
+<div><a href="https://www.esn.org/country/fr">France</a></div>
+<div><a href="/country/ch">Switzerland</a></div>
+</div></div></div></div></div></div></body></html>""",
+    "country/fr/index.html": """<html><body><h1 class="page-header">ESN France</h1>
+<div class="view-content"><a href="/section/paris">Paris</a><a href="/section/lyon/">Lyon</a>
+<a href="/section/paris">Paris again</a><a href="/section/missing">Missing</a>
+<a href="/news/lyon">Not a section</a></div></body></html>""",
+    "country/ch/index.html": """<html><body><h1 class="page-header">ESN Switzerland</h1>
+<div class="view-content"><a href="/section/epfl">EPFL</a><a href="/section/lyon">Lyon</a>
+</div></body></html>""",
+    "section/paris/index.html": """<html><body><h1 class="page-header">ESN Paris</h1>
+<div class="field-name-field-city">Paris</div></body></html>""",
+    "section/lyon/index.html": """<html><body><h1 class="page-header">ESN Lyon</h1>
+<div class="field-name-field-city">Lyon</div></body></html>""",
+    "section/epfl/index.html": """<html><body><h1 class="page-header">ESN EPFL</h1>
+<div class="field-name-field-city">Lausanne</div></body></html>""",
+}
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def mirror_url(tmp_path):
+    for relative_path, html in MIRROR_PAGES.items():
+        path = tmp_path / "mirror" / relative_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(html, encoding="utf-8")
+
+    server = ThreadingHTTPServer(
+        ("127.0.0.1", 0), partial(QuietHandler, directory=str(tmp_path / "mirror"))
+    )
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+
+    server.shutdown()
+    server.server_close()
+
+
+def make_crawler(frontier, mirror_url, crawler_class=SectionCrawler):
+    return crawler_class(
+        frontier, host_policy=HostPolicy(concurrency=2, delay=0.0), mirror_url=mirror_url
+    )
+
+
+def add_country_urls(crawler, mirror_url):
+    main_url = rewrite_url_to_mirror(MAIN_URL, mirror_url)
+    main_soup = get_soup_from_url(main_url, session=crawler.session)
+    crawler.add_country_urls(get_country_urls(main_soup, base_url=main_url))
+
+
+def record_urls(records, mirror_url):
+    return sorted(record["url"].replace(mirror_url, "") for record in records)
+
+
+def test_crawl_mirror(mirror_url):
+    frontier = Frontier()
+    crawler = make_crawler(frontier, mirror_url)
+    add_country_urls(crawler, mirror_url)
+
+    stats = crawler.run()
+
+    # Each section once, whatever the number of links to it
+    assert record_urls(frontier.records, mirror_url) == [
+        "/section/epfl",
+        "/section/lyon",
+        "/section/paris",
+    ]
+
+    records = {record["name"]: record for record in frontier.records}
+    assert records["ESN Paris"]["city"] == "Paris"
+    assert records["ESN Paris"]["country"] == "ESN France"
+    assert records["ESN EPFL"]["country"] == "ESN Switzerland"
+
+    # A missing page fails for good right away instead of waiting for retries
+    assert list(frontier.failed) == [mirror_url + "/section/missing"]
+    assert stats["failed"] == 1
+    assert stats["elapsed"] < crawler.retry_delay
+
+
+def test_resume_from_checkpoint(mirror_url, tmp_path):
+    checkpoint_path = tmp_path / "checkpoint.json"
+
+    # Stop the first run after a few pages, as if it was interrupted
+    class InterruptedCrawler(SectionCrawler):
+        def handle_result(self, task, result):
+            if self.frontier.fetched_count == 3:
+                raise KeyboardInterrupt
+            super().handle_result(task, result)
+
+    frontier = Frontier(checkpoint_path=checkpoint_path)
+    crawler = make_crawler(frontier, mirror_url, crawler_class=InterruptedCrawler)
+    add_country_urls(crawler, mirror_url)
+
+    with pytest.raises(KeyboardInterrupt):
+        crawler.run()
+
+    resumed_frontier = Frontier(checkpoint_path=checkpoint_path)
+    assert resumed_frontier.load()
+    assert resumed_frontier.fetched_count == 3
+
+    stats = make_crawler(resumed_frontier, mirror_url).run()
+
+    assert stats["pages"] == 5
+    assert record_urls(resumed_frontier.records, mirror_url) == [
+        "/section/epfl",
+        "/section/lyon",
+        "/section/paris",
+    ]
+
+
+def http_error(status, headers=None):
+    response = requests.Response()
+    response.status_code = status
+    response.headers.update(headers or {})
+    return requests.HTTPError(response=response)
+
+
+@pytest.mark.parametrize(
+    "error, retryable",
+    [
+        (http_error(404), False),
+        (http_error(403), False),
+        (http_error(429), True),
+        (http_error(503), True),
+        (requests.ConnectionError(), True),
+        (AttributeError(), False),
+    ],
+)
+def test_retryable_errors(error, retryable):
+    assert is_retryable_error(error) == retryable
+
+
+def test_retry_after():
+    assert get_retry_after(http_error(429, {"Retry-After": "12"})) == 12
+    assert get_retry_after(http_error(429)) is None
+    assert get_retry_after(requests.ConnectionError()) is None
+
+    in_a_minute = time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime(time.time() + 60))
+    assert 55 < get_retry_after(http_error(503, {"Retry-After": in_a_minute})) <= 60
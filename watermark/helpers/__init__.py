@@ -1,3 +1,7 @@
 from .file_operations import *
 from .image_manipulation import *
 from .others import *
+from .output_sinks import *
+from .jpeg_passthrough import *
+from .pixel_cache import *
+from .metrics import *
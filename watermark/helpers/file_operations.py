@@ -4,20 +4,38 @@ import shutil
 from pathlib import Path
 
 # External libraries
+import pillow_heif
 import rawpy as rp
 from PIL import Image, ImageSequence, UnidentifiedImageError
 
 # Custom libraries
-from helpers.image_manipulation import tilt_img
-
-
-OTHER_EXTS = (".jpg", ".png", ".jpeg", ".ico", ".webp")
+from helpers.image_manipulation import (
+    tilt_img,
+    get_tilt_angle,
+    AnimatedImage,
+    ANIMATED_FORMATS,
+    EXIF_ORIENTATION_TAG,
+)
+from helpers.jpeg_passthrough import (
+    JpegPassthroughImage,
+    JPEG_EXTS,
+    ROTATION_ORIENTATIONS,
+)
+
+
+OTHER_EXTS = (".jpg", ".png", ".jpeg", ".ico", ".webp", ".gif")
 HEI_EXTS = (".heic", ".heif")
 RAWPY_EXTS = (".nef",)
 IMG_EXTS = OTHER_EXTS + HEI_EXTS + RAWPY_EXTS
 
 IGNORE_EXTS = ".ds_store"
 
+RAWPY_POSTPROCESS_KWARGS = {"use_camera_wb": True}
+
+# Everything that changes the decoded pixels of the expensive formats, part of the pixel cache key
+RAWPY_DECODE_PARAMS = {"rawpy": rp.__version__, "postprocess": RAWPY_POSTPROCESS_KWARGS}
+HEI_DECODE_PARAMS = {"pillow_heif": pillow_heif.__version__, "frame": "primary"}
+
 INVALID_COUNT = 0
 
 
@@ -49,6 +67,10 @@ def invalidate_path(image_path, path_invalid):
     INVALID_COUNT += 1
 
 
+def get_invalid_count():
+    return INVALID_COUNT
+
+
 # Create a directory if it is missing
 def create_dir_if_missing(dir_path):
     try:
@@ -61,7 +83,7 @@ def create_dir_if_missing(dir_path):
 
 def open_rawpy_image(image_path):
     image = rp.imread(image_path)
-    image = image.postprocess(use_camera_wb=True)
+    image = image.postprocess(**RAWPY_POSTPROCESS_KWARGS)
     image = Image.fromarray(image)
     return image
 
@@ -72,7 +94,29 @@ def open_hei_image(image_path):
     return image
 
 
-def universal_load_image(image_path):
+# Load all frames of animated files, other files are left as they are
+def open_other_image(image_path):
+    image = Image.open(image_path)
+
+    if image.format in ANIMATED_FORMATS and getattr(image, "n_frames", 1) > 1:
+        try:
+            return AnimatedImage.from_image(image)
+        except ValueError as e:
+            print(f'\n{e} in "{image_path}", only the first one is watermarked')
+            image.seek(0)
+
+    return image
+
+
+# Decode through the pixel cache if one is given
+def open_cached_image(image_path, decode_params, decode, pixel_cache=None):
+    if pixel_cache is None:
+        return decode(image_path)
+
+    return pixel_cache.load_image(image_path, decode_params, decode)
+
+
+def universal_load_image(image_path, pixel_cache=None):
     image = None
     flag = "img"
     is_hei = False
@@ -80,12 +124,16 @@ def universal_load_image(image_path):
     if extension_match(image_path, IGNORE_EXTS):
         flag = "ignore"
     elif extension_match(image_path, RAWPY_EXTS):
-        image = open_rawpy_image(image_path)
+        image = open_cached_image(
+            image_path, RAWPY_DECODE_PARAMS, open_rawpy_image, pixel_cache=pixel_cache
+        )
     elif extension_match(image_path, HEI_EXTS):
-        image = open_hei_image(image_path)
+        image = open_cached_image(
+            image_path, HEI_DECODE_PARAMS, open_hei_image, pixel_cache=pixel_cache
+        )
         is_hei = True
     elif extension_match(image_path, OTHER_EXTS):
-        image = Image.open(image_path)
+        image = open_other_image(image_path)
     else:
         flag = "invalid"
 
@@ -106,8 +154,31 @@ def attempt_open_image_attempt_tilt(image):
     return image
 
 
-def attempt_open_image(image_path, path_invalid, attempt_rotate):
-    image, flag, is_hei = universal_load_image(image_path)
+# Open a JPEG without decoding it, returns None if it needs the regular pipeline
+def attempt_open_jpeg_passthrough(image_path, attempt_rotate):
+    with Image.open(image_path) as image:
+        orientation = image.getexif().get(EXIF_ORIENTATION_TAG)
+        tilt_angle = get_tilt_angle(image) or 0
+
+    # The orientation tag is copied to the output, viewers would apply it to the watermark too
+    if orientation in range(2, 9) and (
+        not attempt_rotate or orientation not in ROTATION_ORIENTATIONS
+    ):
+        return None
+
+    return JpegPassthroughImage.open(image_path, tilt_angle=tilt_angle)
+
+
+def attempt_open_image(
+    image_path, path_invalid, attempt_rotate, jpeg_passthrough=False, pixel_cache=None
+):
+    if jpeg_passthrough and extension_match(image_path, JPEG_EXTS):
+        image = attempt_open_jpeg_passthrough(image_path, attempt_rotate)
+
+        if image is not None:
+            return image
+
+    image, flag, is_hei = universal_load_image(image_path, pixel_cache=pixel_cache)
 
     if flag == "ignore":
         return None
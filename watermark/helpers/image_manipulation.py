@@ -1,8 +1,13 @@
+# Default libraries
+import math
+
 # External libraries
-from PIL import ImageDraw
+import numpy as np
+from PIL import Image, ImageDraw, ImageSequence
 
 # Custom libraries
 from helpers.others import color_mapping_from_setting  # Needs to disappear
+from helpers.jpeg_passthrough import JpegPassthroughImage, generate_watermarked_jpeg
 
 
 TILT_MAP = {
@@ -14,12 +19,65 @@ TILT_MAP = {
 
 EXIF_ORIENTATION_TAG = 274
 
+CIRCLE_ENGINES = ["analytic", "supersampling"]
+
+# Multi-frame formats that are animations, MPO files from cameras hold previews instead
+ANIMATED_FORMATS = ("GIF", "WEBP")
+
 ESN_CIRCLE_COLOR_MAP = {
     "white": "color",
     None: "white",
 }
 
 
+# Multi-frame image (animated GIF/WebP), every frame is a full canvas of the same size
+class AnimatedImage:
+    def __init__(self, frames, durations, loop, format):
+        self.frames = frames
+        self.durations = durations
+        self.loop = loop
+        self.format = format
+
+    @classmethod
+    def from_image(cls, image):
+        frames = [frame.copy() for frame in ImageSequence.Iterator(image)]
+
+        if any(frame.size != frames[0].size for frame in frames):
+            raise ValueError("Animation frames have different sizes")
+
+        # Keep transparency only if the animation has some
+        has_alpha = image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info
+        mode = "RGBA" if has_alpha else "RGB"
+
+        return cls(
+            frames=[frame.convert(mode) for frame in frames],
+            durations=[frame.info.get("duration", 100) for frame in frames],
+            loop=image.info.get("loop"),
+            format=image.format,
+        )
+
+    @property
+    def size(self):
+        return self.frames[0].size
+
+    def save_kwargs(self):
+        kwargs = {
+            "save_all": True,
+            "append_images": self.frames[1:],
+            "duration": self.durations,
+        }
+
+        if self.loop is not None:
+            kwargs["loop"] = self.loop
+
+        return kwargs
+
+
+# The analytic circle engine renders everything at output resolution
+def get_ss_factor(settings):
+    return settings["ss_factor"] if settings["circle_engine"] == "supersampling" else 1
+
+
 def get_any_dict_value(dictionary):
     return next(iter(dictionary.values()))
 
@@ -28,8 +86,8 @@ def get_dict_value_or_none_value(dictionary: dict, key):
     return dictionary.get(key, dictionary[None])
 
 
-# Auromatically tilt an image based on its EXIF data
-def tilt_img(image):
+# Rotation angle needed to display an image upright, based on its EXIF data
+def get_tilt_angle(image):
     try:
         exif = image._getexif()
     except AttributeError:
@@ -39,9 +97,18 @@ def tilt_img(image):
 
     # Don't tilt if exif orientation value is not between 1 and 8
     if tilt is None or tilt not in range(1, 9):
+        return None
+
+    return TILT_MAP[(tilt - 1) // 2]
+
+
+# Auromatically tilt an image based on its EXIF data
+def tilt_img(image):
+    tilt_idx = get_tilt_angle(image)
+
+    if tilt_idx is None:
         return image
 
-    tilt_idx = TILT_MAP[(tilt - 1) // 2]
     return image.rotate(tilt_idx, expand=True)
 
 
@@ -77,6 +144,17 @@ def draw_ellipse_with_supersampling(image, bbox, color, ss_factor=1):
     return image
 
 
+# Share of each pixel covered by a disk, approximated by a linear ramp on the distance to its edge
+# The ramp is exact where the edge is axis-aligned, and off by up to about 4% of a pixel on diagonals
+def circle_coverage_mask(size, center, radius):
+    w, h = size
+    xs = np.arange(w) + 0.5 - center[0]
+    ys = np.arange(h)[:, None] + 0.5 - center[1]
+
+    coverage = np.clip(radius + 0.5 - np.hypot(xs, ys), 0, 1)
+    return Image.fromarray(np.round(coverage * 255).astype(np.uint8))
+
+
 def dims_from_bbox(bbox):
     x0, y0, x1, y1 = bbox
     return x1 - x0, y1 - y0
@@ -130,8 +208,120 @@ def generate_watermarked_image(
     return watermarked_image
 
 
+# Render the circle and logo once on a transparent patch the size of the watermark
+def generate_watermark_stamp(logo_ss, circle_color, ss_factor, positioning_data):
+    watermark_dims = dims_from_bbox(positioning_data["watermark_bbox"])
+    stamp_ss = Image.new(
+        "RGBA", nearest_integer_scale(watermark_dims, scale_factor=ss_factor)
+    )
+
+    if circle_color is not None:
+        stamp_ss = draw_ellipse_with_supersampling(
+            stamp_ss,
+            bbox=positioning_data["circle_bbox_in_watermark_bbox"],
+            color=tuple(circle_color) + (255,),
+            ss_factor=ss_factor,
+        )
+
+    logo_layer = Image.new("RGBA", stamp_ss.size)
+    logo_layer.paste(
+        logo_ss.convert("RGBA"), positioning_data["logo_pos_in_watermark_ss_bbox"]
+    )
+    stamp_ss = Image.alpha_composite(stamp_ss, logo_layer)
+
+    return resize_to_bbox_size(stamp_ss, bbox=positioning_data["watermark_bbox"])
+
+
+# Resample a source logo once, straight to a fractional position and size
+def place_logo_with_subpixel_accuracy(logo, canvas_size, center, dims):
+    logo_w, logo_h = dims
+    scale_x, scale_y = logo.width / logo_w, logo.height / logo_h
+    left, top = center[0] - logo_w / 2, center[1] - logo_h / 2
+
+    # Whole canvas pixels touched by the logo
+    x0, y0 = math.floor(left), math.floor(top)
+    x1, y1 = math.ceil(left + logo_w), math.ceil(top + logo_h)
+
+    # Transparent margin wider than the filter support, so that the logo edges are interpolated instead of cut
+    margin = math.ceil(2 * max(scale_x, scale_y)) + 2
+    padded_logo = Image.new("RGBA", (logo.width + 2 * margin, logo.height + 2 * margin))
+    padded_logo.paste(logo.convert("RGBA"), (margin, margin))
+
+    # Source area matching those canvas pixels, resize antialiases when downscaling
+    box = (
+        margin + (x0 - left) * scale_x,
+        margin + (y0 - top) * scale_y,
+        margin + (x1 - left) * scale_x,
+        margin + (y1 - top) * scale_y,
+    )
+
+    logo_layer = Image.new("RGBA", canvas_size)
+    logo_layer.paste(
+        padded_logo.resize((x1 - x0, y1 - y0), resample=Image.BICUBIC, box=box), (x0, y0)
+    )
+    return logo_layer
+
+
+# Render the circle coverage and the logo directly at output resolution
+def generate_analytic_watermark_stamp(logo, circle_color, positioning_data):
+    watermark_dims = dims_from_bbox(positioning_data["watermark_bbox"])
+
+    if circle_color is None:
+        stamp = Image.new("RGBA", watermark_dims)
+    else:
+        # Same circle as the supersampling engine, without its scale-dependent rounding
+        x0, y0, x1, y1 = positioning_data["circle_bbox_in_watermark_bbox"]
+        stamp = Image.new("RGBA", watermark_dims, tuple(circle_color) + (0,))
+        stamp.putalpha(
+            circle_coverage_mask(
+                watermark_dims, center=((x0 + x1) / 2, (y0 + y1) / 2), radius=(x1 - x0) / 2
+            )
+        )
+
+    logo_layer = place_logo_with_subpixel_accuracy(
+        logo,
+        canvas_size=watermark_dims,
+        center=positioning_data["logo_center_in_watermark"],
+        dims=positioning_data["logo_dims"],
+    )
+
+    return Image.alpha_composite(stamp, logo_layer)
+
+
+# Composite a stamp on the watermark region of an image only
+def composite_stamp_on_image(image, stamp, watermark_bbox):
+    # Palette and grayscale images are composited in color
+    if image.mode not in ("RGB", "RGBA"):
+        has_alpha = "A" in image.getbands() or "transparency" in image.info
+        image = image.convert("RGBA" if has_alpha else "RGB")
+
+    patch = image.crop(box=watermark_bbox).convert("RGBA")
+    patch.alpha_composite(stamp)
+
+    image = image.copy()
+    image.paste(patch.convert(image.mode), watermark_bbox[:2])
+    return image
+
+
+# Composite the stamp on the watermark region of each frame only
+def generate_watermarked_animation(animation, stamp, watermark_bbox):
+    frames = [
+        composite_stamp_on_image(frame, stamp=stamp, watermark_bbox=watermark_bbox)
+        for frame in animation.frames
+    ]
+
+    return AnimatedImage(
+        frames=frames,
+        durations=animation.durations,
+        loop=animation.loop,
+        format=animation.format,
+    )
+
+
 # Watermark an image with a given position and a list of colors
-def watermark_image_pos(image, path, logos_ss, settings, positioning_data):
+def watermark_image_pos(
+    image, path, logos_ss, settings, positioning_data, position_suffix=""
+):
     color_mapping = color_mapping_from_setting(settings["color_setting"])
 
     # Loop through the selected colors
@@ -142,23 +332,74 @@ def watermark_image_pos(image, path, logos_ss, settings, positioning_data):
         ]
         circle_color = color if settings["draw_circle"] else None
 
-        watermarked_image = generate_watermarked_image(
-            image,
-            logo_ss=logo_ss,
-            circle_color=circle_color,
-            ss_factor=settings["ss_factor"],
-            positioning_data=positioning_data,
-        )
+        if settings["circle_engine"] == "analytic":
+            stamp = generate_analytic_watermark_stamp(
+                logo_ss, circle_color=circle_color, positioning_data=positioning_data
+            )
+        elif isinstance(image, (AnimatedImage, JpegPassthroughImage)):
+            stamp = generate_watermark_stamp(
+                logo_ss,
+                circle_color=circle_color,
+                ss_factor=settings["ss_factor"],
+                positioning_data=positioning_data,
+            )
+
+        if isinstance(image, AnimatedImage):
+            watermarked_image = generate_watermarked_animation(
+                image, stamp=stamp, watermark_bbox=positioning_data["watermark_bbox"]
+            )
+        elif isinstance(image, JpegPassthroughImage):
+            try:
+                watermarked_image = generate_watermarked_jpeg(
+                    image, stamp=stamp, watermark_bbox=positioning_data["watermark_bbox"]
+                )
+            except (RuntimeError, OSError) as e:
+                # Fall back to a full re-encode, for the remaining colors too
+                # OSError if jpegtran can't be run anymore since the startup check
+                print(f'\nCould not watermark "{path}" losslessly, re-encoding it: {e}')
+                image = image.decode()
+                watermarked_image = composite_stamp_on_image(
+                    image, stamp=stamp, watermark_bbox=positioning_data["watermark_bbox"]
+                )
+        elif settings["circle_engine"] == "analytic":
+            watermarked_image = composite_stamp_on_image(
+                image, stamp=stamp, watermark_bbox=positioning_data["watermark_bbox"]
+            )
+        else:
+            watermarked_image = generate_watermarked_image(
+                image,
+                logo_ss=logo_ss,
+                circle_color=circle_color,
+                ss_factor=settings["ss_factor"],
+                positioning_data=positioning_data,
+            )
 
         if len(color_mapping) == 1:
-            suffix = ""
+            suffix = position_suffix
         else:
-            suffix = "_" + str(i)
+            suffix = position_suffix + "_" + str(i)
+
+        # Animations and passthrough JPEGs keep their own format
+        if isinstance(watermarked_image, bytes):
+            output_format = "jpg"
+        elif isinstance(watermarked_image, AnimatedImage):
+            output_format = watermarked_image.format.lower()
+            save_kwargs = watermarked_image.save_kwargs()
+            watermarked_image = watermarked_image.frames[0]
+        else:
+            output_format = settings["format"]
+            save_kwargs = {"compress_level": 4}
 
-    path_out = settings["output_path"] / (
-        settings["prefix"] + path.stem + suffix + "." + settings["format"]
-    )
-    watermarked_image.save(path_out, format="png", compress_level=4)
+        relative_path_out = settings["output_subdir"] / (
+            settings["prefix"] + path.stem + suffix + "." + output_format
+        )
+
+        if isinstance(watermarked_image, bytes):
+            settings["sink"].save_bytes(watermarked_image, relative_path_out)
+        else:
+            settings["sink"].save(
+                watermarked_image, relative_path_out, format=output_format, **save_kwargs
+            )
 
 
 def compute_positioning_data(
@@ -241,6 +482,11 @@ def compute_positioning_data(
     return {
         "watermark_bbox": watermark_bbox,
         "circle_bbox_in_watermark_bbox": circle_bbox_in_watermark,
+        "logo_center_in_watermark": (
+            logo_center_in_watermark_x,
+            logo_center_in_watermark_y,
+        ),
+        "logo_dims": positioning_settings["logo_dims"],
         "logo_pos_in_watermark_ss_bbox": (
             logo_pos_in_watermark_ss_x,
             logo_pos_in_watermark_ss_y,
@@ -257,12 +503,17 @@ def watermark_image(image, path, logos, position_list, settings):
         image_watermark_ratio=settings["image_watermark_ratio"],
     )
 
-    # Get scaled and supersampled logos
-    logos_ss = scale_logos_with_supersampling(
-        logos=logos,
-        target_dims=(target_logo_w, target_logo_h),
-        ss_factor=settings["ss_factor"],
-    )
+    ss_factor = get_ss_factor(settings)
+
+    # Get scaled and supersampled logos, the analytic engine resamples the source logos itself
+    if settings["circle_engine"] == "analytic":
+        logos_ss = logos
+    else:
+        logos_ss = scale_logos_with_supersampling(
+            logos=logos,
+            target_dims=(target_logo_w, target_logo_h),
+            ss_factor=ss_factor,
+        )
 
     # Get logo padding from padding ratio and logo height
     # TODO : Make this configurable (h or w)
@@ -284,6 +535,7 @@ def watermark_image(image, path, logos, position_list, settings):
         "logo_paddings": (logo_padding_x, logo_padding_y),
         "circle_offset_abs": (circle_offset_abs_x, circle_offset_abs_y),
         "circle_radius": circle_radius,
+        "logo_dims": (target_logo_w, target_logo_h),
     }
 
     # Iterate through the given positions
@@ -294,7 +546,7 @@ def watermark_image(image, path, logos, position_list, settings):
             logo_ss_size=get_any_dict_value(logos_ss).size,
             position_str=position_str,
             positioning_settings=positioning_settings,
-            ss_factor=settings["ss_factor"],
+            ss_factor=ss_factor,
         )
 
         watermark_image_pos(
@@ -303,4 +555,6 @@ def watermark_image(image, path, logos, position_list, settings):
             logos_ss=logos_ss,
             positioning_data=positioning_data,
             settings=settings,
+            # Name outputs after their position when there are several of them
+            position_suffix="_" + position_str if len(position_list) > 1 else "",
         )
@@ -0,0 +1,188 @@
+# Default libraries
+import io
+import math
+import os
+import shutil
+import subprocess
+import tempfile
+
+# External libraries
+from PIL import Image
+from PIL.JpegImagePlugin import get_sampling
+
+
+JPEG_EXTS = (".jpg", ".jpeg")
+JPEGTRAN_BIN = "jpegtran"
+
+# Image modes that can be decoded and re-encoded without a colorspace change
+PASSTHROUGH_MODES = ("RGB", "L")
+
+# EXIF orientations that only rotate the image, the other ones also mirror it
+ROTATION_ORIENTATIONS = (3, 6, 8)
+
+
+# Not every jpegtran build has -drop, try it once on a tiny image
+def jpegtran_available():
+    if shutil.which(JPEGTRAN_BIN) is None:
+        return False
+
+    buffer = io.BytesIO()
+    Image.new("L", (16, 16)).save(buffer, format="JPEG")
+
+    try:
+        drop_jpeg(buffer.getvalue(), buffer.getvalue(), (0, 0))
+    except (RuntimeError, OSError):
+        return False
+
+    return True
+
+
+# Run jpegtran on in-memory JPEG data and return the result
+def run_jpegtran(args, data):
+    result = subprocess.run(
+        [JPEGTRAN_BIN, *args], input=data, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+
+    if result.returncode != 0:
+        raise RuntimeError("jpegtran failed: " + result.stderr.decode(errors="replace"))
+
+    return result.stdout
+
+
+# Replace the area of a JPEG at an MCU-aligned offset with another JPEG, without re-encoding
+def drop_jpeg(data, drop_data, offset, args=()):
+    # jpegtran only reads the dropped image from a file
+    fd, drop_path = tempfile.mkstemp(suffix=".jpg")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(drop_data)
+
+        return run_jpegtran(
+            [*args, "-drop", f"+{offset[0]}+{offset[1]}", drop_path], data
+        )
+    finally:
+        os.unlink(drop_path)
+
+
+# Point of an image rotated by a multiple of 90 degrees with Image.rotate(angle, expand=True)
+def rotate_point(point, size, angle):
+    x, y = point
+    w, h = size
+
+    if angle == 90:
+        return y, w - x
+    elif angle == 180:
+        return w - x, h - y
+    elif angle == 270:
+        return h - y, x
+
+    return x, y
+
+
+def rotate_bbox(bbox, size, angle):
+    x0, y0 = rotate_point(bbox[:2], size, angle)
+    x1, y1 = rotate_point(bbox[2:], size, angle)
+    return min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1)
+
+
+def rotate_size(size, angle):
+    return size[::-1] if angle in (90, 270) else size
+
+
+# Grow a bounding box to MCU boundaries, except at the right and bottom edges of the image
+def align_bbox_to_mcu(bbox, mcu_size, image_size):
+    mcu_w, mcu_h = mcu_size
+    x0, y0, x1, y1 = bbox
+
+    return (
+        x0 // mcu_w * mcu_w,
+        y0 // mcu_h * mcu_h,
+        min(image_size[0], math.ceil(x1 / mcu_w) * mcu_w),
+        min(image_size[1], math.ceil(y1 / mcu_h) * mcu_h),
+    )
+
+
+# JPEG file opened without decoding its pixels, sized as it is displayed
+class JpegPassthroughImage:
+    def __init__(self, path, data, stored_size, mcu_size, mode, tilt_angle):
+        self.path = path
+        self.data = data
+        self.stored_size = stored_size
+        self.mcu_size = mcu_size
+        self.mode = mode
+        self.tilt_angle = tilt_angle
+
+    # Returns None if the file can't be watermarked without a full re-encode
+    @classmethod
+    def open(cls, path, tilt_angle=0):
+        data = path.read_bytes()
+
+        with Image.open(io.BytesIO(data)) as jpeg:
+            if jpeg.format != "JPEG" or jpeg.mode not in PASSTHROUGH_MODES:
+                return None
+
+            # Pillow can't encode some chroma layouts (4:4:0, 4:1:1...), nor keep them
+            if jpeg.mode == "RGB" and get_sampling(jpeg) == -1:
+                return None
+
+            # Sampling factors of each component, the largest ones give the MCU size
+            mcu_size = (
+                8 * max(layer[1] for layer in jpeg.layer),
+                8 * max(layer[2] for layer in jpeg.layer),
+            )
+
+            return cls(path, data, jpeg.size, mcu_size, jpeg.mode, tilt_angle)
+
+    @property
+    def size(self):
+        return rotate_size(self.stored_size, self.tilt_angle)
+
+    # Fully decoded image in its displayed orientation, for when jpegtran fails
+    def decode(self):
+        image = Image.open(io.BytesIO(self.data))
+        return image.rotate(self.tilt_angle, expand=True) if self.tilt_angle else image
+
+
+# MCU-aligned region of the stored image that holds a watermark
+def get_passthrough_region(image, watermark_bbox):
+    inverse_angle = (360 - image.tilt_angle) % 360
+    stored_bbox = rotate_bbox(watermark_bbox, image.size, inverse_angle)
+    return align_bbox_to_mcu(stored_bbox, image.mcu_size, image.stored_size)
+
+
+# Re-encode only the MCUs under the watermark, all other DCT blocks and metadata are copied
+def generate_watermarked_jpeg(image, stamp, watermark_bbox):
+    inverse_angle = (360 - image.tilt_angle) % 360
+
+    # Find the MCU-aligned region holding the watermark in the stored orientation
+    region = get_passthrough_region(image, watermark_bbox)
+    region_w, region_h = region[2] - region[0], region[3] - region[1]
+
+    # Losslessly cut the region out and decode only that part
+    patch_data = run_jpegtran(
+        ["-crop", f"{region_w}x{region_h}+{region[0]}+{region[1]}"], image.data
+    )
+
+    with Image.open(io.BytesIO(patch_data)) as patch_jpeg:
+        qtables = patch_jpeg.quantization
+        subsampling = get_sampling(patch_jpeg)
+        patch = patch_jpeg.convert("RGBA")
+
+    # Composite the stamp in the displayed orientation, then turn the patch back
+    displayed_region = rotate_bbox(region, image.stored_size, image.tilt_angle)
+    patch = patch.rotate(image.tilt_angle, expand=True)
+    patch.alpha_composite(
+        stamp,
+        dest=(
+            watermark_bbox[0] - displayed_region[0],
+            watermark_bbox[1] - displayed_region[1],
+        ),
+    )
+    patch = patch.rotate(inverse_angle, expand=True).convert(image.mode)
+
+    patch_buffer = io.BytesIO()
+    patch.save(patch_buffer, format="JPEG", qtables=qtables, subsampling=subsampling)
+
+    return drop_jpeg(
+        image.data, patch_buffer.getvalue(), region[:2], args=["-copy", "all", "-trim"]
+    )
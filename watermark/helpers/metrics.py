@@ -0,0 +1,171 @@
+# Default libraries
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+
+METRICS_PREFIX = "esn_watermark_"
+
+# Prometheus type and help text of every exported value
+PROMETHEUS_METRICS = {
+    "images_found": ("gauge", "Images found so far in the input folders"),
+    "images_done": ("counter", "Images watermarked successfully"),
+    "images_failed": ("counter", "Images that raised an error while processing"),
+    "images_invalid": ("counter", "Images moved to the invalid folder"),
+    "queue_depth": ("gauge", "Images found but not processed yet"),
+    "bytes_in": ("counter", "Bytes read from processed input files"),
+    "bytes_out": ("counter", "Bytes written by the output sink"),
+    "images_per_second": ("gauge", "Processed images per second since the start"),
+    "mb_in_per_second": ("gauge", "Input megabytes per second since the start"),
+    "mb_out_per_second": ("gauge", "Output megabytes per second since the start"),
+    "eta_seconds": ("gauge", "Estimated seconds left for the images found so far"),
+    "elapsed_seconds": ("gauge", "Seconds since the start of the run"),
+}
+
+
+# Counters and gauges of a watermarking run, safe to update from several workers
+class RunMetrics:
+    def __init__(self, sink=None):
+        self.sink = sink
+        self.start_time = time.monotonic()
+        self._lock = threading.Lock()
+        self.images_found = 0
+        self.images_done = 0
+        self.images_failed = 0
+        self.images_invalid = 0
+        self.bytes_in = 0
+        self.worker_busy = {}
+
+    def add_images(self, count):
+        with self._lock:
+            self.images_found += count
+
+    def record_done(self, bytes_in=0):
+        with self._lock:
+            self.images_done += 1
+            self.bytes_in += bytes_in
+
+    def record_failed(self):
+        with self._lock:
+            self.images_failed += 1
+
+    def record_invalid(self):
+        with self._lock:
+            self.images_invalid += 1
+
+    # Measure the time a worker spends on an image
+    @contextmanager
+    def track(self, worker="main"):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.worker_busy[worker] = (
+                    self.worker_busy.get(worker, 0.0) + time.monotonic() - start
+                )
+
+    def snapshot(self):
+        bytes_out = self.sink.bytes_written if self.sink is not None else 0
+
+        with self._lock:
+            elapsed = max(time.monotonic() - self.start_time, 1e-9)
+            processed = self.images_done + self.images_failed + self.images_invalid
+            queue_depth = self.images_found - processed
+            images_per_second = processed / elapsed
+
+            return {
+                "timestamp": time.time(),
+                "elapsed_seconds": elapsed,
+                "images_found": self.images_found,
+                "images_done": self.images_done,
+                "images_failed": self.images_failed,
+                "images_invalid": self.images_invalid,
+                "queue_depth": queue_depth,
+                "bytes_in": self.bytes_in,
+                "bytes_out": bytes_out,
+                "images_per_second": images_per_second,
+                "mb_in_per_second": self.bytes_in / 2**20 / elapsed,
+                "mb_out_per_second": bytes_out / 2**20 / elapsed,
+                "eta_seconds": (
+                    queue_depth / images_per_second if images_per_second > 0 else None
+                ),
+                "worker_utilization": {
+                    worker: busy / elapsed for worker, busy in self.worker_busy.items()
+                },
+            }
+
+
+def format_prometheus(snapshot):
+    lines = []
+
+    for key, (metric_type, help_text) in PROMETHEUS_METRICS.items():
+        if snapshot[key] is None:
+            continue
+
+        # Prometheus counter names end with _total
+        name = METRICS_PREFIX + key + ("_total" if metric_type == "counter" else "")
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        lines.append(f"{name} {snapshot[key]}")
+
+    name = METRICS_PREFIX + "worker_utilization"
+    lines.append(f"# HELP {name} Share of the elapsed time each worker spent processing")
+    lines.append(f"# TYPE {name} gauge")
+    for worker, utilization in snapshot["worker_utilization"].items():
+        lines.append(f'{name}{{worker="{worker}"}} {utilization}')
+
+    return "\n".join(lines) + "\n"
+
+
+# Periodically write metrics as JSON lines and/or a Prometheus textfile from a background thread
+class MetricsExporter:
+    def __init__(self, metrics, jsonl_path=None, prometheus_path=None, interval=10.0):
+        self.metrics = metrics
+        self.jsonl_path = Path(jsonl_path) if jsonl_path else None
+        self.prometheus_path = Path(prometheus_path) if prometheus_path else None
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def export(self):
+        snapshot = self.metrics.snapshot()
+
+        if self.jsonl_path is not None:
+            with open(self.jsonl_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(snapshot) + "\n")
+
+        # The textfile collector may read at any time, replace the file atomically
+        if self.prometheus_path is not None:
+            tmp_path = self.prometheus_path.with_name(self.prometheus_path.name + ".tmp")
+            tmp_path.write_text(format_prometheus(snapshot), encoding="utf-8")
+            os.replace(tmp_path, self.prometheus_path)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            # A failed write (full disk, missing folder...) must not stop the next ones
+            try:
+                self.export()
+            except Exception as e:
+                print(f"\nFailed to export metrics: {e}")
+
+    def start(self):
+        if self.jsonl_path is not None or self.prometheus_path is not None:
+            self._thread.start()
+        return self
+
+    # Stop the thread and write the final values
+    def stop(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+            self.export()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -71,7 +71,7 @@ def position_list_from_setting(position):
 
 
 # Setup argument parser
-def setup_argparser(default_vals, color_options, pos_choices):
+def setup_argparser(default_vals, color_options, pos_choices, circle_engines):
     ap = argparse.ArgumentParser(
         description="ESN Lausanne Watermark Inserter",
         formatter_class=argparse.RawTextHelpFormatter,
@@ -121,6 +121,66 @@ def setup_argparser(default_vals, color_options, pos_choices):
             default_vals["output_dir"]
         ),
     )
+    ap.add_argument(
+        "-jp",
+        "--jpeg-passthrough",
+        action="store_true",
+        help="save JPEG inputs as JPEG, re-encoding only the blocks under the watermark (requires jpegtran)",
+    )
+    ap.add_argument(
+        "-cd",
+        "--cache-dir",
+        action="store",
+        type=str,
+        default=None,
+        help="cache decoded RAW/HEIC pixels in this directory to speed up reruns",
+    )
+    ap.add_argument(
+        "-cs",
+        "--cache-size",
+        action="store",
+        type=float,
+        default=default_vals["cache_size"],
+        metavar="MB",
+        help="maximum size of the pixel cache in megabytes (default is {})".format(
+            default_vals["cache_size"]
+        ),
+    )
+    ap.add_argument(
+        "-mj",
+        "--metrics-jsonl",
+        action="store",
+        type=str,
+        default=None,
+        help="periodically append run metrics as JSON lines to this file",
+    )
+    ap.add_argument(
+        "-mp",
+        "--metrics-prom",
+        action="store",
+        type=str,
+        default=None,
+        help="periodically write run metrics to this Prometheus textfile",
+    )
+    ap.add_argument(
+        "-mi",
+        "--metrics-interval",
+        action="store",
+        type=float,
+        default=default_vals["metrics_interval"],
+        metavar="SECONDS",
+        help="interval between two metrics exports (default is {})".format(
+            default_vals["metrics_interval"]
+        ),
+    )
+    ap.add_argument(
+        "-a",
+        "--archive",
+        action="store",
+        type=str,
+        default=None,
+        help="write all outputs into a single .zip, .tar or .tar.gz archive instead of the output directory",
+    )
     ap.add_argument(
         "-wms",
         "--watermark-size",
@@ -158,10 +218,22 @@ def setup_argparser(default_vals, color_options, pos_choices):
         type=int,
         default=default_vals["ss_factor"],
         metavar="FACTOR",
-        help="set the supersampling factor for smoothing the circle (default is {}, smaller means faster execution but less smoothing)".format(
+        help="set the supersampling factor for smoothing the circle with the 'supersampling' engine (default is {}, smaller means faster execution but less smoothing)".format(
             default_vals["ss_factor"]
         ),
     )
+    ap.add_argument(
+        "-ce",
+        "--circle-engine",
+        type=str,
+        default=default_vals["circle_engine"],
+        choices=circle_engines,
+        help=textwrap.dedent(
+            "set how the circle is drawn, options are the following:\n"
+            + "> 'analytic' [Exact antialiasing at output resolution, default value]\n"
+            + "> 'supersampling' [Previous engine, drawn at a larger scale then downsampled]"
+        ),
+    )
     ap.add_argument(
         "-c",
         "--color",
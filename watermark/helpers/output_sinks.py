@@ -0,0 +1,172 @@
+# Default libraries
+import io
+import itertools
+import tarfile
+import threading
+import time
+import zipfile
+from pathlib import Path, PurePosixPath
+
+
+ZIP_EXTS = (".zip",)
+TAR_EXTS = (".tar", ".tar.gz", ".tgz")
+ARCHIVE_EXTS = ZIP_EXTS + TAR_EXTS
+
+# Write buffer for archive streams, turns many small images into large sequential writes
+ARCHIVE_BUFFER_SIZE = 8 * 1024 * 1024
+
+
+# Encode an image in memory so the costly part can run outside of the sink's lock
+def encode_image(image, format, **save_kwargs):
+    buffer = io.BytesIO()
+    image.save(buffer, format=format, **save_kwargs)
+    return buffer.getvalue()
+
+
+def is_archive_supported(archive_path):
+    return str(archive_path).lower().endswith(ARCHIVE_EXTS)
+
+
+# First free name of the form "name_2.ext", "name_3.ext"...
+def get_unique_name(name, names):
+    path = PurePosixPath(name)
+
+    for i in itertools.count(2):
+        unique_name = path.with_name(f"{path.stem}_{i}{path.suffix}").as_posix()
+        if unique_name not in names:
+            return unique_name
+
+
+# Destination of the watermarked images, paths are relative to the output root
+class OutputSink:
+    def __init__(self):
+        self.bytes_written = 0
+        self._bytes_lock = threading.Lock()
+
+    def _count_bytes(self, count):
+        with self._bytes_lock:
+            self.bytes_written += count
+
+    def save(self, image, relative_path, format, **save_kwargs):
+        raise NotImplementedError
+
+    # Store an already encoded file as is
+    def save_bytes(self, data, relative_path):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# Write every image as a separate file, mirroring the input folder structure
+class DirectorySink(OutputSink):
+    def __init__(self, root_path):
+        super().__init__()
+        self.root_path = Path(root_path)
+
+    def save(self, image, relative_path, format, **save_kwargs):
+        path_out = self.root_path / relative_path
+        path_out.parent.mkdir(parents=True, exist_ok=True)
+        image.save(path_out, format=format, **save_kwargs)
+        self._count_bytes(path_out.stat().st_size)
+
+    def save_bytes(self, data, relative_path):
+        path_out = self.root_path / relative_path
+        path_out.parent.mkdir(parents=True, exist_ok=True)
+        path_out.write_bytes(data)
+        self._count_bytes(len(data))
+
+
+# Append images to a single archive as they are produced, safe to share between threads
+class ArchiveSink(OutputSink):
+    def __init__(self, archive_path):
+        super().__init__()
+        self.archive_path = Path(archive_path)
+        self.archive_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._file = open(self.archive_path, "wb", buffering=ARCHIVE_BUFFER_SIZE)
+        self._names = set()
+
+    def save(self, image, relative_path, format, **save_kwargs):
+        self.save_bytes(encode_image(image, format=format, **save_kwargs), relative_path)
+
+    def save_bytes(self, data, relative_path):
+        name = PurePosixPath(*Path(relative_path).parts).as_posix()
+
+        with self._lock:
+            # Archives can hold the same name twice, but extractors then prompt or fail
+            if name in self._names:
+                unique_name = get_unique_name(name, self._names)
+                print(f'\n"{name}" is already in "{self.archive_path}", saving as "{unique_name}"')
+                name = unique_name
+
+            self._names.add(name)
+            self._write_member(name, data)
+
+        self._count_bytes(len(data))
+
+    def _write_member(self, name, data):
+        raise NotImplementedError
+
+    def _close_archive(self):
+        raise NotImplementedError
+
+    def close(self):
+        with self._lock:
+            if self._file.closed:
+                return
+
+            self._close_archive()
+            self._file.close()
+
+
+class ZipSink(ArchiveSink):
+    def __init__(self, archive_path):
+        super().__init__(archive_path)
+        self._archive = zipfile.ZipFile(self._file, mode="w")
+
+    def _write_member(self, name, data):
+        # Images are already compressed, store them as is
+        self._archive.writestr(name, data, compress_type=zipfile.ZIP_STORED)
+
+    def _close_archive(self):
+        self._archive.close()
+
+
+class TarSink(ArchiveSink):
+    def __init__(self, archive_path):
+        super().__init__(archive_path)
+        mode = "w|gz" if self.archive_path.name.lower().endswith(TAR_EXTS[1:]) else "w|"
+        self._archive = tarfile.open(fileobj=self._file, mode=mode)
+
+    def _write_member(self, name, data):
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = int(time.time())
+        self._archive.addfile(info, io.BytesIO(data))
+
+    def _close_archive(self):
+        self._archive.close()
+
+
+# Pick the sink matching the archive extension, or a directory sink when no archive is given
+def sink_from_setting(output_path, archive_path=None):
+    if archive_path is None:
+        return DirectorySink(output_path)
+
+    archive_name = str(archive_path).lower()
+
+    if archive_name.endswith(ZIP_EXTS):
+        return ZipSink(archive_path)
+    elif archive_name.endswith(TAR_EXTS):
+        return TarSink(archive_path)
+
+    raise ValueError(
+        "Unsupported archive format. Expected one of: " + ", ".join(ARCHIVE_EXTS)
+    )
@@ -0,0 +1,115 @@
+# Default libraries
+import hashlib
+import os
+import tempfile
+import time
+from pathlib import Path
+
+# External libraries
+import numpy as np
+from PIL import Image
+
+
+# Bump when the way cached pixels are produced changes, to ignore older entries
+CACHE_VERSION = 1
+CACHE_EXT = ".npy"
+TMP_EXT = ".tmp"
+
+# Temporary files older than this were left by a crashed run, younger ones may still be written
+STALE_TMP_SECONDS = 3600
+
+
+# On-disk cache of decoded pixels, entries are memory-mapped back and evicted least recently used first
+class PixelCache:
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.evict()
+
+    # Key on the file identity and on whatever changes the decoded pixels
+    def key(self, image_path, decode_params):
+        stat = Path(image_path).stat()
+        identity = "|".join(
+            str(elem)
+            for elem in [
+                CACHE_VERSION,
+                Path(image_path).resolve(),
+                stat.st_size,
+                stat.st_mtime_ns,
+                decode_params,
+            ]
+        )
+        return hashlib.sha1(identity.encode()).hexdigest()
+
+    def entry_path(self, key):
+        return self.cache_dir / (key + CACHE_EXT)
+
+    def get(self, key):
+        entry_path = self.entry_path(key)
+
+        try:
+            pixels = np.load(entry_path, mmap_mode="r")
+        except (FileNotFoundError, ValueError, OSError):
+            return None
+
+        # Refresh the access time used for eviction
+        os.utime(entry_path)
+        return pixels
+
+    def put(self, key, pixels):
+        pixels = np.ascontiguousarray(pixels)
+
+        if pixels.nbytes > self.max_bytes:
+            return
+
+        # Write to a temporary file first so readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=TMP_EXT)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, pixels)
+            os.replace(tmp_path, self.entry_path(key))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+        self.evict()
+
+    # Remove least recently used entries until the cache fits in its size cap
+    def evict(self):
+        stale_time = time.time() - STALE_TMP_SECONDS
+        for tmp_path in self.cache_dir.glob("*" + TMP_EXT):
+            try:
+                if tmp_path.stat().st_mtime < stale_time:
+                    tmp_path.unlink()
+            except FileNotFoundError:
+                continue
+
+        entries = []
+        for entry_path in self.cache_dir.glob("*" + CACHE_EXT):
+            try:
+                stat = entry_path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry_path))
+
+        total_bytes = sum(size for _, size, _ in entries)
+
+        for _, size, entry_path in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+
+            entry_path.unlink(missing_ok=True)
+            total_bytes -= size
+
+    # Return the cached image, or decode it with the given function and cache it
+    def load_image(self, image_path, decode_params, decode):
+        key = self.key(image_path, decode_params)
+        pixels = self.get(key)
+
+        if pixels is None:
+            image = decode(image_path)
+            self.put(key, np.asarray(image))
+            return image
+
+        return Image.fromarray(pixels)
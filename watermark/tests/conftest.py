@@ -0,0 +1,7 @@
+# Default libraries
+import sys
+from pathlib import Path
+
+# The scripts import their helpers relative to the watermark folder
+WATERMARK_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(WATERMARK_DIR))
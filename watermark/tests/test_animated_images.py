@@ -0,0 +1,48 @@
+# External libraries
+import pytest
+from PIL import Image
+
+# Custom libraries
+from helpers.file_operations import attempt_open_image
+from helpers.image_manipulation import AnimatedImage, EXIF_ORIENTATION_TAG
+
+
+def open_image(path, tmp_path):
+    return attempt_open_image(path, path_invalid=tmp_path / "invalid", attempt_rotate=True)
+
+
+@pytest.mark.parametrize("extension", [".gif", ".webp"])
+def test_animation_keeps_its_frames(tmp_path, extension):
+    path = tmp_path / ("animation" + extension)
+    frames = [Image.new("RGB", (80, 60), (255 * i // 2, 0, 0)) for i in range(3)]
+    frames[0].save(path, save_all=True, append_images=frames[1:], duration=50, loop=0)
+
+    image = open_image(path, tmp_path)
+
+    assert isinstance(image, AnimatedImage)
+    assert len(image.frames) == 3
+    assert image.size == (80, 60)
+    assert image.save_kwargs()["loop"] == 0
+
+
+# Camera JPEGs are often MPO files with a small preview as second frame
+def test_mpo_is_a_still_image(tmp_path):
+    path = tmp_path / "camera.jpg"
+    exif = Image.Exif()
+    exif[EXIF_ORIENTATION_TAG] = 6
+    preview = Image.new("RGB", (160, 120))
+    Image.new("RGB", (800, 600)).save(
+        path, format="MPO", save_all=True, append_images=[preview], exif=exif
+    )
+
+    with Image.open(path) as mpo:
+        assert mpo.format == "MPO" and mpo.n_frames == 2
+
+        # Frames of different sizes can't make an animation
+        with pytest.raises(ValueError):
+            AnimatedImage.from_image(mpo)
+
+    image = open_image(path, tmp_path)
+
+    assert not isinstance(image, AnimatedImage)
+    assert image.size == (600, 800)
@@ -0,0 +1,87 @@
+# Default libraries
+from pathlib import Path
+
+# External libraries
+import numpy as np
+import pytest
+from PIL import Image
+
+# Custom libraries
+from conftest import WATERMARK_DIR
+from helpers.image_manipulation import watermark_image
+
+
+# Reference supersampling factor, close enough to the exact coverage
+REFERENCE_SS_FACTOR = 16
+
+SETTINGS = {
+    "image_watermark_ratio": 0.07,
+    "logo_padding_ratio": 0.15,
+    "logo_circle_ratio": 1.6,
+    "circle_offset_ratio_x": 0.6,
+    "circle_offset_ratio_y": 1,
+    "color_setting": "magenta",
+    "prefix": "",
+    "format": "png",
+    "output_subdir": Path(),
+}
+
+
+# Keep the watermarked image in memory instead of writing it
+class MemorySink:
+    def save(self, image, relative_path, format, **save_kwargs):
+        self.image = image
+
+
+@pytest.fixture(scope="module")
+def logos():
+    return {
+        "color": Image.open(WATERMARK_DIR / "logos" / "logo_color.png"),
+        "white": Image.open(WATERMARK_DIR / "logos" / "logo_white.png"),
+    }
+
+
+# Smooth gradient, so that any difference comes from the watermark
+@pytest.fixture(scope="module")
+def image():
+    y, x = np.mgrid[0:1500, 0:2000]
+    pixels = np.stack([x * 255 // 2000, y * 255 // 1500, np.full_like(x, 90)], axis=-1)
+    return Image.fromarray(pixels.astype(np.uint8))
+
+
+def render(image, logos, circle_engine, ss_factor, draw_circle):
+    sink = MemorySink()
+    settings = dict(
+        SETTINGS,
+        circle_engine=circle_engine,
+        ss_factor=ss_factor,
+        draw_circle=draw_circle,
+        sink=sink,
+    )
+    watermark_image(image, Path("image.png"), logos, ["bottom_right"], settings)
+    return np.asarray(sink.image).astype(float)
+
+
+# RMS and max difference with the reference, over the watermark corner
+def patch_difference(pixels, reference):
+    difference = np.abs(pixels - reference)[1200:, 1700:]
+    return np.sqrt((difference**2).mean()), difference.max()
+
+
+@pytest.mark.parametrize("draw_circle", [True, False])
+def test_analytic_engine_matches_high_supersampling(image, logos, draw_circle):
+    reference = render(image, logos, "supersampling", REFERENCE_SS_FACTOR, draw_circle)
+    analytic = render(image, logos, "analytic", 1, draw_circle)
+    supersampled = render(image, logos, "supersampling", 4, draw_circle)
+
+    analytic_rms, analytic_max = patch_difference(analytic, reference)
+    supersampled_rms, supersampled_max = patch_difference(supersampled, reference)
+
+    # At least as close to the reference as supersampling with ss_factor 4 (the CLI default is 2)
+    assert analytic_rms <= supersampled_rms
+    assert analytic_max <= supersampled_max
+    assert analytic_rms < 2
+    assert analytic_max < 40
+
+    # Nothing is drawn outside of the watermark
+    assert np.array_equal(analytic[:1200], reference[:1200])
@@ -0,0 +1,133 @@
+# Default libraries
+import io
+import os
+from pathlib import Path
+
+# External libraries
+import numpy as np
+import pytest
+from PIL import Image
+
+# Custom libraries
+from conftest import WATERMARK_DIR
+from helpers import jpeg_passthrough
+from helpers.file_operations import attempt_open_jpeg_passthrough
+from helpers.image_manipulation import EXIF_ORIENTATION_TAG, watermark_image
+from helpers.jpeg_passthrough import (
+    JpegPassthroughImage,
+    generate_watermarked_jpeg,
+    get_passthrough_region,
+    jpegtran_available,
+)
+
+
+# Set REQUIRE_JPEGTRAN=1 where jpegtran is installed so that these tests fail instead of being skipped
+requires_jpegtran = pytest.mark.skipif(
+    not jpegtran_available() and os.environ.get("REQUIRE_JPEGTRAN") != "1",
+    reason="jpegtran with -drop is needed",
+)
+
+# Any bytes are kept as is, a real profile isn't needed
+ICC_PROFILE = b"icc profile placeholder"
+
+
+def write_jpeg(path, subsampling=0, orientation=None):
+    y, x = np.mgrid[0:480, 0:640]
+    pixels = np.stack([x * 255 // 640, y * 255 // 480, (x * y) % 256], axis=-1)
+
+    exif = Image.Exif()
+    exif[0x010F] = "ESN camera"
+    if orientation is not None:
+        exif[EXIF_ORIENTATION_TAG] = orientation
+
+    Image.fromarray(pixels.astype(np.uint8)).save(
+        path,
+        format="JPEG",
+        quality=90,
+        subsampling=subsampling,
+        exif=exif,
+        icc_profile=ICC_PROFILE,
+    )
+    return path
+
+
+@requires_jpegtran
+@pytest.mark.parametrize("subsampling", [0, 2])
+@pytest.mark.parametrize("tilt_angle", [0, 90])
+def test_pixels_outside_region_are_kept(tmp_path, subsampling, tilt_angle):
+    path = write_jpeg(tmp_path / "image.jpg", subsampling=subsampling)
+    image = JpegPassthroughImage.open(path, tilt_angle=tilt_angle)
+
+    watermark_bbox = (100, 150, 230, 260)
+    stamp = Image.new("RGBA", (130, 110), (255, 0, 255, 200))
+    output = generate_watermarked_jpeg(image, stamp=stamp, watermark_bbox=watermark_bbox)
+
+    with Image.open(path) as jpeg:
+        input_pixels = np.asarray(jpeg.convert("RGB"))
+        input_exif = jpeg.info["exif"]
+    with Image.open(io.BytesIO(output)) as jpeg:
+        output_pixels = np.asarray(jpeg.convert("RGB"))
+        assert jpeg.info["exif"] == input_exif
+        assert jpeg.info["icc_profile"] == ICC_PROFILE
+
+    # Upsampled chroma blends with the neighbouring blocks, skip the pixels bordering the region
+    x0, y0, x1, y1 = get_passthrough_region(image, watermark_bbox)
+    outside = np.ones(input_pixels.shape[:2], dtype=bool)
+    outside[max(0, y0 - 1) : y1 + 1, max(0, x0 - 1) : x1 + 1] = False
+
+    assert np.array_equal(input_pixels[outside], output_pixels[outside])
+    assert not np.array_equal(input_pixels, output_pixels)
+
+
+# Viewers apply the copied orientation tag, mirrored or unrotated outputs need the full pipeline
+@pytest.mark.parametrize(
+    "orientation, attempt_rotate, passthrough",
+    [(None, False, True), (1, False, True), (6, True, True), (6, False, False), (2, True, False)],
+)
+def test_orientation_tag_matches_output(tmp_path, orientation, attempt_rotate, passthrough):
+    path = write_jpeg(tmp_path / "image.jpg", orientation=orientation)
+    image = attempt_open_jpeg_passthrough(path, attempt_rotate=attempt_rotate)
+
+    assert (image is not None) == passthrough
+
+
+class MemorySink:
+    def save(self, image, relative_path, format, **save_kwargs):
+        self.saved = (image, relative_path)
+
+    def save_bytes(self, data, relative_path):
+        self.saved = (data, relative_path)
+
+
+# jpegtran disappearing after the startup check falls back to a full re-encode
+def test_missing_jpegtran_falls_back(tmp_path, monkeypatch):
+    monkeypatch.setattr(jpeg_passthrough, "JPEGTRAN_BIN", str(tmp_path / "missing-jpegtran"))
+
+    path = write_jpeg(tmp_path / "image.jpg")
+    image = JpegPassthroughImage.open(path)
+    logos = {
+        "color": Image.open(WATERMARK_DIR / "logos" / "logo_color.png"),
+        "white": Image.open(WATERMARK_DIR / "logos" / "logo_white.png"),
+    }
+    sink = MemorySink()
+    settings = {
+        "image_watermark_ratio": 0.07,
+        "logo_padding_ratio": 0.15,
+        "logo_circle_ratio": 1.6,
+        "circle_offset_ratio_x": 0.6,
+        "circle_offset_ratio_y": 1,
+        "ss_factor": 2,
+        "circle_engine": "analytic",
+        "draw_circle": True,
+        "color_setting": "magenta",
+        "prefix": "wm_",
+        "format": "png",
+        "output_subdir": Path(),
+        "sink": sink,
+    }
+
+    watermark_image(image, path, logos, ["bottom_right"], settings)
+
+    watermarked_image, relative_path = sink.saved
+    assert relative_path == Path("wm_image.png")
+    assert watermarked_image.size == (640, 480)
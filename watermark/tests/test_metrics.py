@@ -0,0 +1,25 @@
+# Default libraries
+import json
+import time
+
+# Custom libraries
+from helpers.metrics import MetricsExporter, RunMetrics
+
+
+def test_exporter_keeps_running_after_a_failed_export(tmp_path):
+    jsonl_path = tmp_path / "missing" / "metrics.jsonl"
+    metrics = RunMetrics()
+    metrics.add_images(3)
+
+    with MetricsExporter(metrics, jsonl_path=jsonl_path, interval=0.01) as exporter:
+        # The first exports fail until the folder exists
+        time.sleep(0.05)
+        assert exporter._thread.is_alive()
+
+        jsonl_path.parent.mkdir()
+        metrics.record_done()
+        time.sleep(0.05)
+
+    snapshots = [json.loads(line) for line in jsonl_path.read_text().splitlines()]
+    assert snapshots[-1]["images_done"] == 1
+    assert snapshots[-1]["queue_depth"] == 2
@@ -0,0 +1,114 @@
+# Default libraries
+import io
+import tarfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# External libraries
+import pytest
+from PIL import Image
+
+# Custom libraries
+from helpers.output_sinks import (
+    DirectorySink,
+    TarSink,
+    ZipSink,
+    is_archive_supported,
+    sink_from_setting,
+)
+
+
+PRODUCERS = 8
+IMAGES_PER_PRODUCER = 25
+
+
+# Every producer writes its own images to its own subfolder
+def produce(sink, producer):
+    for i in range(IMAGES_PER_PRODUCER):
+        image = Image.new("RGB", (16, 8), (producer, i, 0))
+        sink.save(image, Path(f"folder_{producer}") / f"wm_{i}.png", format="png")
+
+
+def write_concurrently(sink):
+    with sink, ThreadPoolExecutor(max_workers=PRODUCERS) as executor:
+        list(executor.map(lambda producer: produce(sink, producer), range(PRODUCERS)))
+
+
+def expected_names():
+    return sorted(
+        f"folder_{producer}/wm_{i}.png"
+        for producer in range(PRODUCERS)
+        for i in range(IMAGES_PER_PRODUCER)
+    )
+
+
+def check_image(data, name):
+    producer, i = int(name.split("/")[0].split("_")[1]), int(name.split("_")[-1][:-4])
+    with Image.open(io.BytesIO(data)) as image:
+        assert image.getpixel((0, 0)) == (producer, i, 0)
+
+
+def test_zip_concurrent_writes(tmp_path):
+    archive_path = tmp_path / "output.zip"
+    write_concurrently(sink_from_setting(tmp_path, archive_path=archive_path))
+
+    with zipfile.ZipFile(archive_path) as archive:
+        assert archive.testzip() is None
+        assert sorted(archive.namelist()) == expected_names()
+        for name in archive.namelist():
+            check_image(archive.read(name), name)
+
+
+@pytest.mark.parametrize("archive_name", ["output.tar", "output.tar.gz"])
+def test_tar_concurrent_writes(tmp_path, archive_name):
+    archive_path = tmp_path / archive_name
+    sink = sink_from_setting(tmp_path, archive_path=archive_path)
+    assert isinstance(sink, TarSink)
+    write_concurrently(sink)
+
+    with tarfile.open(archive_path) as archive:
+        members = archive.getmembers()
+        assert sorted(member.name for member in members) == expected_names()
+        for member in members:
+            check_image(archive.extractfile(member).read(), member.name)
+
+    assert sink.bytes_written == sum(member.size for member in members)
+
+
+def test_directory_layout(tmp_path):
+    write_concurrently(sink_from_setting(tmp_path / "output"))
+
+    written = sorted(
+        path.relative_to(tmp_path / "output").as_posix()
+        for path in (tmp_path / "output").rglob("*.png")
+    )
+    assert written == expected_names()
+
+
+# The second image with the same name is renamed instead of hidden behind the first one
+def test_duplicate_names_are_renamed(tmp_path):
+    archive_path = tmp_path / "output.zip"
+
+    with ZipSink(archive_path) as sink:
+        sink.save_bytes(b"first", Path("folder") / "wm_a.png")
+        sink.save_bytes(b"second", Path("folder") / "wm_a.png")
+        sink.save_bytes(b"third", Path("folder") / "wm_a.png")
+
+    with zipfile.ZipFile(archive_path) as archive:
+        assert archive.namelist() == [
+            "folder/wm_a.png",
+            "folder/wm_a_2.png",
+            "folder/wm_a_3.png",
+        ]
+        assert archive.read("folder/wm_a_3.png") == b"third"
+
+
+def test_unsupported_archive(tmp_path):
+    assert is_archive_supported("output.TAR.GZ")
+    assert not is_archive_supported("output.rar")
+
+    with pytest.raises(ValueError):
+        sink_from_setting(tmp_path, archive_path=tmp_path / "output.rar")
+
+    assert isinstance(sink_from_setting(tmp_path), DirectorySink)
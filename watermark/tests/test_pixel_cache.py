@@ -0,0 +1,84 @@
+# Default libraries
+import os
+
+# External libraries
+import numpy as np
+from PIL import Image
+
+# Custom libraries
+from helpers.file_operations import RAWPY_DECODE_PARAMS, RAWPY_POSTPROCESS_KWARGS
+from helpers.pixel_cache import STALE_TMP_SECONDS, PixelCache
+
+
+def make_pixels(value):
+    return np.full((10, 10, 3), value, dtype=np.uint8)
+
+
+def test_cache_hit(tmp_path):
+    image_path = tmp_path / "image.nef"
+    image_path.write_bytes(b"raw data")
+    cache = PixelCache(tmp_path / "cache", max_bytes=2**20)
+    decoded_paths = []
+
+    def decode(path):
+        decoded_paths.append(path)
+        return Image.fromarray(make_pixels(42))
+
+    first = cache.load_image(image_path, RAWPY_DECODE_PARAMS, decode)
+    second = cache.load_image(image_path, RAWPY_DECODE_PARAMS, decode)
+
+    assert decoded_paths == [image_path]
+    assert np.array_equal(np.asarray(first), np.asarray(second))
+
+    # Other decoding settings don't reuse the entry
+    other_params = dict(RAWPY_DECODE_PARAMS, postprocess={"use_camera_wb": False})
+    cache.load_image(image_path, other_params, decode)
+    assert len(decoded_paths) == 2
+
+
+def test_key_follows_decode_settings(tmp_path):
+    image_path = tmp_path / "image.nef"
+    image_path.write_bytes(b"raw data")
+    cache = PixelCache(tmp_path / "cache", max_bytes=2**20)
+
+    # The decode call and the key share their settings
+    assert RAWPY_DECODE_PARAMS["postprocess"] is RAWPY_POSTPROCESS_KWARGS
+    assert "rawpy" in RAWPY_DECODE_PARAMS
+
+    key = cache.key(image_path, RAWPY_DECODE_PARAMS)
+    assert key == cache.key(image_path, dict(RAWPY_DECODE_PARAMS))
+    assert key != cache.key(image_path, dict(RAWPY_DECODE_PARAMS, rawpy="0.0.0"))
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = PixelCache(tmp_path, max_bytes=2**20)
+    cache.put("a", make_pixels(1))
+    entry_size = cache.entry_path("a").stat().st_size
+    cache.max_bytes = 3 * entry_size
+
+    cache.put("b", make_pixels(2))
+    cache.put("c", make_pixels(3))
+    for age, key in enumerate(["c", "b", "a"]):
+        old_time = 1_000_000 - age
+        os.utime(cache.entry_path(key), (old_time, old_time))
+
+    # Reading "a" makes "b" the least recently used entry
+    assert cache.get("a")[0, 0, 0] == 1
+    cache.put("d", make_pixels(4))
+
+    assert cache.get("b") is None
+    assert [cache.get(key)[0, 0, 0] for key in ["a", "c", "d"]] == [1, 3, 4]
+
+
+def test_stale_temporary_files_are_removed(tmp_path):
+    stale_path = tmp_path / "crashed.tmp"
+    recent_path = tmp_path / "writing.tmp"
+    stale_path.write_bytes(b"partial")
+    recent_path.write_bytes(b"partial")
+    old_time = stale_path.stat().st_mtime - STALE_TMP_SECONDS - 1
+    os.utime(stale_path, (old_time, old_time))
+
+    PixelCache(tmp_path, max_bytes=2**20)
+
+    assert not stale_path.exists()
+    assert recent_path.exists()
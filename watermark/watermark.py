@@ -7,7 +7,7 @@ from PIL import Image
 from pillow_heif import register_heif_opener
 
 # Custom libraries
-from helpers.image_manipulation import watermark_image
+from helpers.image_manipulation import watermark_image, CIRCLE_ENGINES
 from helpers.file_operations import (
     create_dir_if_missing,
     glob_all_except,
@@ -15,7 +15,12 @@ from helpers.file_operations import (
     attempt_open_image,
     IMG_EXTS,
     scandir,
+    get_invalid_count,
 )
+from helpers.jpeg_passthrough import jpegtran_available
+from helpers.output_sinks import sink_from_setting, is_archive_supported, ARCHIVE_EXTS
+from helpers.pixel_cache import PixelCache
+from helpers.metrics import RunMetrics, MetricsExporter
 
 from helpers.others import (  # Needs to become a * import
     setup_argparser,
@@ -45,6 +50,9 @@ if __name__ == "__main__":
         "input_dir": "input",
         "output_dir": "output",
         "format": "png",
+        "cache_size": 4096,
+        "metrics_interval": 10,
+        "circle_engine": CIRCLE_ENGINES[0],
     }
 
     # Other parameters
@@ -67,6 +75,7 @@ if __name__ == "__main__":
         default_vals=default_values,
         color_options=COLOR_OPTIONS,
         pos_choices=POSITION_OPTIONS,
+        circle_engines=CIRCLE_ENGINES,
     )
     args = vars(ap.parse_args())
 
@@ -83,8 +92,9 @@ if __name__ == "__main__":
         "circle_offset_ratio_x": 0.5 if args["center_circle"] else 3 / 5,
         "circle_offset_ratio_y": 0.5 if args["center_circle"] else 1,
         "ss_factor": args["supersampling"],
+        "circle_engine": args["circle_engine"],
         "draw_circle": not args["no_circle"],
-        "output_path": path_output,
+        "output_subdir": Path(),
         "color_setting": args["color"],
         "prefix": prefix,  # TODO : Offer option to customise the prefix
         "format": default_values[
@@ -92,6 +102,17 @@ if __name__ == "__main__":
         ],  # TODO : Offer option to change output format
     }
 
+    if args["jpeg_passthrough"] and not jpegtran_available():
+        print("jpegtran with -drop support not found, JPEG inputs will be fully re-encoded")
+        args["jpeg_passthrough"] = False
+
+    # Decoded RAW/HEIC pixels are reused across runs if asked to
+    pixel_cache = None
+    if args["cache_dir"] is not None:
+        pixel_cache = PixelCache(
+            root_path / args["cache_dir"], max_bytes=int(args["cache_size"] * 2**20)
+        )
+
     if not path_input.is_dir():
         sys.exit(
             "Input folder not found. Make sure you arguments are correct or use the default '"
@@ -99,76 +120,118 @@ if __name__ == "__main__":
             + "' folder."
         )
 
-    all_input_directories = [str(path_input)] + scandir(path_input)
-    for current_directory in all_input_directories:
-        current_input_path = Path(current_directory)
-        current_output_path = path_output / current_input_path.relative_to(path_input)
-        current_invalid_path = path_invalid / current_input_path.relative_to(path_input)
-
-        # Create missing folders if needed
-        create_dir_if_missing(current_output_path)
-        create_dir_if_missing(current_invalid_path)
-
-        all_paths = glob_all_except(current_input_path, excluded_patterns=["*.gitkeep"])
-        image_paths = [p for p in all_paths if not p.is_dir()]
-
-        if len(image_paths) == 0:
-            print(f'Skipping folder "{current_input_path}" (no images found)')
-            continue
-
-        print(f'Processing folder "{current_input_path}"')
-
-        # Flush all images in the output directory if asked to
-        if args["flush"]:
-            flush_output(current_output_path, IMG_EXTS)
-
-        # Apply to all images
-        invalid_count = 0
-
-        # TODO : Condition this
-        # Enable the HEIF/HEIC Pillow plugin
-        register_heif_opener()
-
-        # Loop through images
-        for processed_count, image_path in enumerate(image_paths):
-            try:
-                image = attempt_open_image(
-                    image_path=image_path,
-                    path_invalid=current_invalid_path,
-                    attempt_rotate=not args["no_rotate"],
-                )
-
-                if image is None:
-                    continue
-
-                # Randomize position if asked
-                position_list = position_list_from_setting(position_setting)
-                color_mapping = color_mapping_from_setting(settings["color_setting"])
-
-                print(
-                    "Processing image",
-                    processed_count + 1,
-                    "of",
-                    len(image_paths),
-                    "| Invalid:",
-                    invalid_count,
-                    end="\r",
-                )
-
-                # Watermark picture
-                watermark_image(
-                    image,
-                    path=image_path,
-                    logos=logos,
-                    position_list=position_list,
-                    settings={
-                        **settings,
-                        "output_path": current_output_path,
-                    },
-                )
-
-            except Exception as e:
-                print(f'\nFailed to process image "{image_path}": {e}')
-
-        print()
-        print("Done")
+    if args["archive"] is not None and not is_archive_supported(args["archive"]):
+        sys.exit(
+            "Unsupported archive format. Use one of the following extensions: "
+            + ", ".join(ARCHIVE_EXTS)
+        )
+
+    # Images are saved to the output directory or streamed into a single archive
+    sink = sink_from_setting(path_output, archive_path=args["archive"])
+
+    # Live counters, exported periodically for unattended runs if asked to
+    metrics = RunMetrics(sink=sink)
+    exporter = MetricsExporter(
+        metrics,
+        jsonl_path=args["metrics_jsonl"],
+        prometheus_path=args["metrics_prom"],
+        interval=args["metrics_interval"],
+    )
+
+    with sink, exporter:
+        all_input_directories = [str(path_input)] + scandir(path_input)
+
+        # List every folder up front so the queue depth and ETA cover the whole run
+        image_paths_by_directory = {}
+        for current_directory in all_input_directories:
+            all_paths = glob_all_except(Path(current_directory), excluded_patterns=["*.gitkeep"])
+            image_paths_by_directory[current_directory] = [
+                p for p in all_paths if not p.is_dir()
+            ]
+
+        metrics.add_images(sum(len(paths) for paths in image_paths_by_directory.values()))
+
+        for current_directory in all_input_directories:
+            current_input_path = Path(current_directory)
+            current_output_subdir = current_input_path.relative_to(path_input)
+            current_output_path = path_output / current_output_subdir
+            current_invalid_path = path_invalid / current_output_subdir
+
+            # Create missing folders if needed
+            if args["archive"] is None:
+                create_dir_if_missing(current_output_path)
+            create_dir_if_missing(current_invalid_path)
+
+            image_paths = image_paths_by_directory[current_directory]
+
+            if len(image_paths) == 0:
+                print(f'Skipping folder "{current_input_path}" (no images found)')
+                continue
+
+            print(f'Processing folder "{current_input_path}"')
+
+            # Flush all images in the output directory if asked to
+            if args["flush"] and args["archive"] is None:
+                flush_output(current_output_path, IMG_EXTS)
+
+            # TODO : Condition this
+            # Enable the HEIF/HEIC Pillow plugin
+            register_heif_opener()
+
+            # Loop through images
+            for processed_count, image_path in enumerate(image_paths):
+                invalid_count = get_invalid_count()
+
+                with metrics.track():
+                    try:
+                        image = attempt_open_image(
+                            image_path=image_path,
+                            path_invalid=current_invalid_path,
+                            attempt_rotate=not args["no_rotate"],
+                            jpeg_passthrough=args["jpeg_passthrough"],
+                            pixel_cache=pixel_cache,
+                        )
+
+                        if image is None:
+                            if get_invalid_count() > invalid_count:
+                                metrics.record_invalid()
+                            else:
+                                # Ignored files are not counted as images
+                                metrics.add_images(-1)
+                            continue
+
+                        # Randomize position if asked
+                        position_list = position_list_from_setting(position_setting)
+                        color_mapping = color_mapping_from_setting(settings["color_setting"])
+
+                        print(
+                            "Processing image",
+                            processed_count + 1,
+                            "of",
+                            len(image_paths),
+                            "| Invalid:",
+                            get_invalid_count(),
+                            end="\r",
+                        )
+
+                        # Watermark picture
+                        watermark_image(
+                            image,
+                            path=image_path,
+                            logos=logos,
+                            position_list=position_list,
+                            settings={
+                                **settings,
+                                "output_subdir": current_output_subdir,
+                                "sink": sink,
+                            },
+                        )
+
+                        metrics.record_done(bytes_in=image_path.stat().st_size)
+
+                    except Exception as e:
+                        metrics.record_failed()
+                        print(f'\nFailed to process image "{image_path}": {e}')
+
+            print()
+            print("Done")